@@ -3,57 +3,98 @@
 # created by SilverJiang
 # ---------- 导入依赖 ----------
 import os
-import json
-import time
+import re
+import random
 import getpass
-import requests
-from bs4 import BeautifulSoup, NavigableString
-
-# ---------- MySQL 驱动回退：优先 mysql-connector，否则尝试 pymysql ----------
-try:
-    import mysql.connector as mysql_connector
-    MYSQL_DRIVER = "mysql-connector"
-except Exception:
-    try:
-        import pymysql as mysql_connector
-        MYSQL_DRIVER = "pymysql"
-    except Exception:
-        print("未安装 MySQL 驱动。请先运行：")
-        print("  python -m pip install mysql-connector-python requests")
-        print("或  python -m pip install pymysql requests")
-        raise
+import asyncio
+import hashlib
+import queue
+import threading
+import httpx
+import orjson
+import lxml.html
+
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor
+
+# MySQL 驱动按需导入，见 load_mysql_driver()
+MYSQL_DRIVER = None
+mysql_connector = None
 
 CONFIG_FILE = "config.json"
 SELECTION_FILE = "./selections.json"
 
+# 匹配完整标签 <p ...>、</div>、<!-- -->；只有 < 没有 > 的文本（如 "a<b"）不算 HTML
+HTML_TAG_RE = re.compile(r"<[a-zA-Z/!][^>]*>")
+# 以 <html> / <head> / <body>（前面可有空白和 DOCTYPE）开头的按文档处理，否则按片段处理
+HTML_DOC_RE = re.compile(r"^\s*(?P<doctype><!DOCTYPE[^>]*>)?\s*<(?P<tag>html|head|body)[\s>]", re.I)
+# 片段中出现 DOCTYPE 或 <html> / <head> / <body> 时 lxml 片段解析会把它们丢掉，整段按原文提交翻译
+RAW_FRAGMENT_RE = re.compile(r"<!DOCTYPE|</?(?:html|head|body)[\s>/]", re.I)
+# 含字母（任意语言）的文本才需要翻译；纯数字 / 标点 / 空白原样保留
+TRANSLATABLE_RE = re.compile(r"[^\W\d_]")
+# 不含可翻译内容的常见占位文本，原样写回
+UNTRANSLATABLE_TEXTS = {"&nbsp;", "-", "—"}
+
+# 异步翻译：每个 DB 窗口抓取 batch_size * WINDOW_BATCHES 行并发翻译
+WINDOW_BATCHES = 10
+MAX_CONCURRENT_REQUESTS = 16
+HTTP_LIMITS = httpx.Limits(max_connections=MAX_CONCURRENT_REQUESTS, max_keepalive_connections=MAX_CONCURRENT_REQUESTS)
+# 读取 → 翻译 → 写回 流水线中每个队列最多缓存的窗口数
+PIPELINE_DEPTH = 4
+# 微软翻译单次请求上限：100 条文本、50000 字符
+MAX_TEXTS_PER_REQUEST = 100
+MAX_CHARS_PER_REQUEST = 50000
+# 单条合并 UPDATE 的参数字节上限，远低于 MySQL 5.7 默认 max_allowed_packet（4MB）
+MAX_UPDATE_BYTES = 1024 * 1024
+# 单条合并 UPDATE 的行数上限：每行 3 个占位符，预处理语句最多 65535 个占位符
+MAX_UPDATE_ROWS = 2000
+# 译文缓存：最多保留的条数（LRU 淘汰）；超过长度的文本几乎不会重复，不缓存
+CACHE_MAX_ENTRIES = 20000
+CACHE_MAX_TEXT_LEN = 1000
+# 重试退避上限（秒）
+MAX_RETRY_DELAY = 30
+# 数据库连接池大小：translate_and_update 读取、写回各占一个连接（连接池创建时即全部建立）
+DB_POOL_SIZE = 2
+
 
 # ---------- 工具函数 ----------
 
 def is_html(text: str) -> bool:
     """
 简单判断是否为 HTML 文本
-- 含有 <tag> 或 &nbsp; 等常见 HTML 特征
+- 含有 <tag> 等常见 HTML 特征（正则扫描，无需解析整棵树）
     """
     if not text:
         return False
-    if "<" in text and ">" in text:
-        try:
-            soup = BeautifulSoup(text, "html.parser")
-            return bool(soup.find())  # 如果有标签，算 HTML
-        except Exception:
-            return False
-    return False
+    return HTML_TAG_RE.search(text) is not None
 
 def load_json_if_exists(path):
     if os.path.exists(path):
-        with open(path, "r", encoding="utf-8") as f:
-            return json.load(f)
+        with open(path, "rb") as f:
+            return orjson.loads(f.read())
     return None
 
 
 def save_json(path, obj):
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(obj, f, ensure_ascii=False, indent=2)
+    with open(path, "wb") as f:
+        f.write(orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
+
+
+def retry_delay(attempt, response=None):
+    """
+重试前等待的秒数（均带随机抖动，避免并发请求同时重试）
+- 429 / 503 且带 Retry-After：按服务端要求等待
+- 其他情况：指数退避，上限 MAX_RETRY_DELAY
+    """
+    if response is not None and response.status_code in (429, 503):
+        retry_after = response.headers.get("Retry-After")
+        if retry_after:
+            try:
+                return float(retry_after) + random.random()
+            except ValueError:
+                pass
+    return min(MAX_RETRY_DELAY, 2 ** attempt) * (0.5 + random.random())
 
 
 def quote_ident(name):
@@ -61,52 +102,80 @@ def quote_ident(name):
 
 
 # ---------- 数据库连接（兼容两种驱动） ----------
+def load_mysql_driver():
+    """
+按需导入 MySQL 驱动（只导入实际使用的一个）：优先 mysql-connector，否则尝试 pymysql
+    """
+    global MYSQL_DRIVER, mysql_connector
+    if MYSQL_DRIVER is not None:
+        return mysql_connector
+    try:
+        import mysql.connector as driver
+        name = "mysql-connector"
+    except Exception:
+        try:
+            import pymysql as driver
+            name = "pymysql"
+        except Exception:
+            print("未安装 MySQL 驱动。请先运行：")
+            print("  python -m pip install mysql-connector-python httpx[http2] orjson lxml")
+            print("或  python -m pip install pymysql httpx[http2] orjson lxml")
+            raise
+    mysql_connector, MYSQL_DRIVER = driver, name
+    return driver
+
+
 def get_db_connection(cfg):
-    host = cfg.get("host", "localhost")
-    port = cfg.get("port", 3306)
-    user = cfg.get("user", "root")
-    password = cfg.get("password", "")
-    database = cfg.get("database")
+    driver = load_mysql_driver()
+    params = dict(
+        host=cfg.get("host", "localhost"),
+        port=cfg.get("port", 3306),
+        user=cfg.get("user", "root"),
+        password=cfg.get("password", ""),
+        charset="utf8mb4",
+        autocommit=False,
+    )
+    if MYSQL_DRIVER == "mysql-connector":
+        return driver.connect(database=cfg.get("database"), **params)
+    # pymysql: 参数名是 db
+    return driver.connect(db=cfg.get("database"), **params)
+
+
+@dataclass
+class DBPool:
+    """
+数据库连接池及库名（库名保存在这里，不再挂到驱动的连接对象上）
+- pool: mysql-connector 连接池，取出的连接 close() 后归还
+- pymysql 没有内置连接池，pool 为 None，get_connection() 每次新建连接
+    """
+    cfg: dict
+    database: str
+    pool: object = None
+
+    def get_connection(self):
+        if self.pool is None:
+            return get_db_connection(self.cfg)
+        return self.pool.get_connection()
 
+
+def get_db_pool(cfg, pool_size=DB_POOL_SIZE):
+    load_mysql_driver()
+    pool = None
     if MYSQL_DRIVER == "mysql-connector":
-        conn = mysql_connector.connect(
-            host=host,
-            port=port,
-            user=user,
-            password=password,
-            database=database,
+        from mysql.connector import pooling
+        pool = pooling.MySQLConnectionPool(
+            pool_name="translate",
+            pool_size=pool_size,
+            pool_reset_session=False,
+            host=cfg.get("host", "localhost"),
+            port=cfg.get("port", 3306),
+            user=cfg.get("user", "root"),
+            password=cfg.get("password", ""),
+            database=cfg.get("database"),
             charset="utf8mb4",
             autocommit=False,
         )
-        # mysql-connector 有 conn.database 属性
-        try:
-            conn.database = database
-        except Exception:
-            pass
-    else:
-        # pymysql: 参数名是 db
-        conn = mysql_connector.connect(
-            host=host,
-            port=port,
-            user=user,
-            password=password,
-            db=database,
-            charset="utf8mb4",
-        )
-        # 尝试关闭自动提交（若可用）
-        try:
-            conn.autocommit(False)
-        except Exception:
-            try:
-                conn.autocommit = False
-            except Exception:
-                pass
-        # 给连接对象附加 database 属性以兼容旧代码
-        try:
-            conn.database = database
-        except Exception:
-            pass
-    return conn
+    return DBPool(cfg=cfg, database=cfg.get("database"), pool=pool)
 
 
 # ---------- schema / 表 / 列 查询 ----------
@@ -124,7 +193,15 @@ ORDER BY TABLE_NAME
     return rows
 
 
+# 本次运行内的 INFORMATION_SCHEMA 查询缓存（与连接无关，按库/表缓存）
+_TABLE_COLUMNS_CACHE = {}        # (schema, table) -> [(col, dtype, key), ...]
+_VERIFIED_TARGET_COLUMNS = set()  # {(schema, table, target_col), ...}
+
+
 def list_table_columns(conn, schema, table):
+    cached = _TABLE_COLUMNS_CACHE.get((schema, table))
+    if cached is not None:
+        return cached
     cursor = conn.cursor()
     sql = """
 SELECT COLUMN_NAME, DATA_TYPE, COLUMN_KEY
@@ -135,6 +212,7 @@ ORDER BY ORDINAL_POSITION
     cursor.execute(sql, (schema, table))
     rows = cursor.fetchall()
     cursor.close()
+    _TABLE_COLUMNS_CACHE[(schema, table)] = rows
     return rows
 
 
@@ -146,9 +224,12 @@ def detect_primary_key(conn, schema, table):
     return cols[0][0] if cols else None
 
 
-def add_target_column_if_needed(conn, table, target_col, schema=None):
-    # schema 如果为 None，则尝试使用 conn.database
-    dbname = schema or getattr(conn, "database", None)
+def add_target_column_if_needed(conn, table, target_col, schema):
+    # schema 必须显式传入（调用方使用 DBPool.database）：pymysql 连接没有 database 属性，
+    # 不能从连接上推断库名
+    dbname = schema
+    if (dbname, table, target_col) in _VERIFIED_TARGET_COLUMNS:
+        return
     cursor = conn.cursor()
     sql = """
 SELECT COUNT(*)
@@ -164,49 +245,186 @@ WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s AND COLUMN_NAME = %s
         cursor.execute(alter_sql)
         conn.commit()
         cursor.close()
+        # 表结构已变化，列缓存失效
+        _TABLE_COLUMNS_CACHE.pop((dbname, table), None)
         print(f"已创建列 {target_col} 于表 {table}")
+    _VERIFIED_TARGET_COLUMNS.add((dbname, table, target_col))
 
 
-# ---------- HTML 文本节点提取 ----------
-def extract_text_nodes(html: str):
-    soup = BeautifulSoup(html, "html.parser")
-    nodes = []
+def _prepared_cursor(conn):
+    """
+mysql-connector 预处理游标（二进制协议）：同一条 SQL 只在服务端解析一次，之后只传参数
+- 仅当传入的是同一个 SQL 字符串对象时才复用预处理语句，SQL 需预先构造好
+- pymysql 不支持预处理语句，退回普通游标
+    """
+    if MYSQL_DRIVER == "mysql-connector":
+        return conn.cursor(prepared=True)
+    return conn.cursor()
+
+
+@dataclass
+class ColumnSQL:
+    """
+处理一个 (表, 列) 用到的全部 SQL，在进入循环前一次构造好，循环内只传参数
+- 预处理游标按 SQL 字符串对象复用预处理语句，这些字符串在整列处理期间保持不变
+    """
+    count: str
+    select_first: str
+    select_next: str
+    update_head: str
+    update_where: str
+    _updates: dict = field(default_factory=dict)
+
+    def update(self, n):
+        """
+n 行合并为一条 UPDATE ... CASE（只写目标列），按行数缓存
+        """
+        sql = self._updates.get(n)
+        if sql is None:
+            sql = self._updates[n] = f"""
+{self.update_head} {" ".join(["WHEN %s THEN %s"] * n)} END
+{self.update_where} ({", ".join(["%s"] * n)})
+"""
+        return sql
+
+
+def build_column_sql(table, pk, col, target_col):
+    q_table, q_pk, q_col, q_tgt = map(quote_ident, (table, pk, col, target_col))
+    pending = f"""{q_col} IS NOT NULL
+  AND {q_col} <> ''
+  AND ({q_tgt} IS NULL OR {q_tgt} = '')"""
+    select_tmpl = f"""
+SELECT {q_pk}, {q_col}
+FROM {q_table}
+WHERE {{seek}}{pending}
+ORDER BY {q_pk}
+LIMIT %s
+"""
+    return ColumnSQL(
+        count=f"""
+SELECT COUNT(*)
+FROM {q_table}
+WHERE {pending}
+""",
+        select_first=select_tmpl.format(seek=""),
+        select_next=select_tmpl.format(seek=f"{q_pk} > %s AND "),
+        update_head=f"UPDATE {q_table}\nSET {q_tgt} = CASE {q_pk}",
+        update_where=f"WHERE {q_pk} IN",
+    )
+
 
-    def recurse(el, path=""):
-        for idx, child in enumerate(el.contents):
-            child_path = f"{path}/{el.name}[{idx}]" if el.name else path
-            if isinstance(child, NavigableString):
-                text = child.strip()
-                if text:
-                    nodes.append({
-                        "text": text,
-                        "parent_tag": el.name if el.name else "",
-                        "attrs": dict(el.attrs) if el.name else {},
-                        "path": child_path
-                    })
+def iter_pending_pages(conn, column_sql, page_size=100):
+    """
+按页读取待翻译的行，每次产出一页 [(pk, text), ...]
+- 按主键 keyset 分页：每页从上一页最后的主键之后开始，避免 OFFSET 扫描
+- 整列复用同一个预处理游标；每页读完即提交，读取连接不会长时间挂着事务
+    """
+    cursor = _prepared_cursor(conn)
+    try:
+        last_id = None
+        while True:
+            if last_id is None:
+                cursor.execute(column_sql.select_first, (page_size,))
             else:
-                recurse(child, path=child_path)
+                cursor.execute(column_sql.select_next, (last_id, page_size))
+            rows = cursor.fetchall()
+            # 读取连接不写数据：每页读完即结束事务，释放一致性快照和表的元数据锁
+            conn.commit()
+            if not rows:
+                return
+            last_id = rows[-1][0]
+            yield rows
+            if len(rows) < page_size:
+                return
+    finally:
+        cursor.close()
 
-    recurse(soup, path="")
+
+# ---------- HTML 文本节点提取 ----------
+def _parse_html(html: str):
+    """
+解析 HTML：文档按文档解析，片段外层包一个 <div> 容器
+    """
+    if HTML_DOC_RE.match(html):
+        return lxml.html.document_fromstring(html)
+    return lxml.html.fragment_fromstring(html, create_parent="div")
+
+
+def _serialize_html(root, html: str):
+    """
+序列化 _parse_html 解析出的树，保持原文的外层结构
+- 以 <html> 开头：输出整个文档（原文有 DOCTYPE 时保留）
+- 以 <head> / <body> 开头：只输出 <html> 下的 head / body，不补 <html>
+- 片段：去掉外层的 <div> 容器
+    """
+    m = HTML_DOC_RE.match(html)
+    if m is None:
+        out = lxml.html.tostring(root, encoding="unicode")
+        return out[len("<div>"):-len("</div>")]
+    # 原文没有 DOCTYPE 时 libxml2 会补一个默认值，不能输出
+    doctype = root.getroottree().docinfo.doctype if m.group("doctype") else None
+    if m.group("tag").lower() == "html":
+        if doctype:
+            return lxml.html.tostring(root.getroottree(), encoding="unicode", doctype=doctype)
+        return lxml.html.tostring(root, encoding="unicode")
+    out = "".join(lxml.html.tostring(child, encoding="unicode") for child in root)
+    return f"{doctype}\n{out}" if doctype else out
+
+
+def _text_slots(root):
+    """
+收集所有需要翻译的文本所在位置 [(element, "text" | "tail"), ...]
+- 一次 XPath 在 libxml2 中取出全部非空文本节点（按文档顺序，不含注释内容）
+    """
+    slots = []
+    for t in root.xpath("//text()[normalize-space()]"):
+        if TRANSLATABLE_RE.search(t):
+            slots.append((t.getparent(), "text" if t.is_text else "tail"))
+    return slots
+
+
+def _parse_and_collect(html: str):
+    """
+只解析一次 HTML：返回 (root, slots, texts)，翻译后用 _render_html 写回同一棵树
+- lxml 无法无损解析的片段（见 RAW_FRAGMENT_RE）不解析：root 为 None，整段作为一个文本，
+  翻译 API 使用 textType=html，会原样保留其中的标签
+    """
+    if not HTML_DOC_RE.match(html) and RAW_FRAGMENT_RE.search(html):
+        return None, [], [html] if TRANSLATABLE_RE.search(html) else []
+    root = _parse_html(html)
+    slots = _text_slots(root)
+    texts = [getattr(el, attr).strip() for el, attr in slots]
+    return root, slots, texts
+
+
+def _render_html(root, slots, html: str, translated_texts):
+    """
+把译文写回 _parse_and_collect 解析出的树并序列化；整段提交的片段直接返回译文
+    """
+    if root is None:
+        return translated_texts[0] if translated_texts else html
+    for (el, attr), text in zip(slots, translated_texts):
+        setattr(el, attr, text)
+    return _serialize_html(root, html)
+
+
+def extract_text_nodes(html: str):
+    root, slots, texts = _parse_and_collect(html)
+    if root is None:
+        return [{"text": text, "parent_tag": ""} for text in texts]
+    nodes = []
+    for (el, attr), text in zip(slots, texts):
+        parent = el if attr == "text" else el.getparent()
+        nodes.append({
+            "text": text,
+            "parent_tag": parent.tag if parent is not None and parent is not root else "",
+        })
     return nodes
 
 # ---------- HTML 重建 ----------
 def rebuild_html_from_nodes(html: str, translated_texts: list):
-    soup = BeautifulSoup(html, "html.parser")
-    idx = 0
-
-    def recurse_replace(el):
-        nonlocal idx
-        for child in el.contents:
-            if isinstance(child, NavigableString):
-                if child.strip() and idx < len(translated_texts):
-                    child.replace_with(translated_texts[idx])
-                    idx += 1
-            else:
-                recurse_replace(child)
-
-    recurse_replace(soup)
-    return str(soup)
+    root, slots, _ = _parse_and_collect(html)
+    return _render_html(root, slots, html, translated_texts)
 
 
 # ---------- 翻译 API 封装 ----------
@@ -219,32 +437,114 @@ class TranslatorAPI_MIC:
         self.region = region
         self.target_lang = target_lang
         self.endpoint = endpoint.rstrip("/")
+        # 本次运行内的译文缓存（LRU）：sha1(目标语言, 原文) -> 译文，重复文本不再请求 API
+        self._cache = OrderedDict()
+        # 异步客户端与事件循环在整个运行期间复用，保持 HTTP/2 连接
+        self._loop = None
+        self._client = None
 
-    def translate_batch(self, texts, lang=None, retry=3, timeout=30):
-        if not texts:
-            return []
-
+    def _url(self, lang=None):
         target_lang = lang if lang else self.target_lang
-        url = f"{self.endpoint}/translate?api-version=3.0&to={target_lang}&textType=html"
+        return f"{self.endpoint}/translate?api-version=3.0&to={target_lang}&textType=html"
 
-        headers = {
+    def _headers(self):
+        return {
             "Ocp-Apim-Subscription-Key": self.key,
             "Ocp-Apim-Subscription-Region": self.region,
             "Content-Type": "application/json",
         }
+
+    @staticmethod
+    def _parse_translations(data):
+        out = []
+        for item in data:
+            tr = item.get("translations", [])
+            out.append(tr[0].get("text", "") if tr else "")
+        return out
+
+    @staticmethod
+    def _cache_key(text, lang):
+        return hashlib.sha1(f"{lang}\0{text}".encode("utf-8")).digest()
+
+    def _lookup_cache(self, texts, lang=None):
+        """
+查询缓存：返回 (命中的 {原文: 译文}, 未命中的原文列表)，均已去重
+        """
+        target_lang = lang if lang else self.target_lang
+        found, misses = {}, []
+        for t in dict.fromkeys(texts):
+            key = self._cache_key(t, target_lang)
+            tr = self._cache.get(key)
+            if tr is None:
+                misses.append(t)
+            else:
+                self._cache.move_to_end(key)
+                found[t] = tr
+        return found, misses
+
+    def _store_cache(self, texts, translated, lang=None):
+        target_lang = lang if lang else self.target_lang
+        for t, tr in zip(texts, translated):
+            # 失败的空译文不缓存，保证下次还会重试；长文本几乎不会重复，不占内存
+            if tr and len(t) <= CACHE_MAX_TEXT_LEN:
+                key = self._cache_key(t, target_lang)
+                self._cache[key] = tr
+                self._cache.move_to_end(key)
+        while len(self._cache) > CACHE_MAX_ENTRIES:
+            self._cache.popitem(last=False)
+
+    def _run(self, coro):
+        """
+在翻译器自己的事件循环中执行协程（同步接口与异步接口共用同一个 HTTP/2 客户端）
+        """
+        if self._loop is None:
+            self._loop = asyncio.new_event_loop()
+        return self._loop.run_until_complete(coro)
+
+    def translate_batch(self, texts, lang=None, retry=3, timeout=30):
+        return self._run(self.translate_batch_async(texts, lang=lang, retry=retry, timeout=timeout))
+
+    def translate_html(self, html, lang=None):
+        """
+翻译 HTML：解析并提取文本 → 批量翻译 → 写回同一棵树
+        """
+        root, slots, texts = _parse_and_collect(html)
+        if not texts:
+            return html
+        return _render_html(root, slots, html, self.translate_batch(texts, lang=lang))
+
+    # ---------- 异步接口 ----------
+    def _get_async_client(self):
+        if self._client is None:
+            self._client = httpx.AsyncClient(http2=True, timeout=30, limits=HTTP_LIMITS)
+        return self._client
+
+    async def translate_batch_async(self, texts, lang=None, retry=3, timeout=30):
+        if not texts:
+            return []
+
+        found, misses = self._lookup_cache(texts, lang)
+        if misses:
+            translated = await self._request_batch_async(misses, lang, retry, timeout)
+            self._store_cache(misses, translated, lang)
+            found.update(zip(misses, translated))
+        return [found[t] for t in texts]
+
+    async def _request_batch_async(self, texts, lang=None, retry=3, timeout=30):
+        client = self._get_async_client()
+        url = self._url(lang)
+        headers = self._headers()
         body = [{"Text": t} for t in texts]
+        # 只序列化一次，重试时复用
+        data = orjson.dumps(body)
 
         attempt = 0
         while attempt < retry:
+            r = None
             try:
-                r = requests.post(url, headers=headers, json=body, timeout=timeout)
+                r = await client.post(url, headers=headers, content=data, timeout=timeout)
                 if r.status_code == 200:
-                    data = r.json()
-                    out = []
-                    for item in data:
-                        tr = item.get("translations", [])
-                        out.append(tr[0].get("text", "") if tr else "")
-                    return out
+                    return self._parse_translations(orjson.loads(r.content))
                 else:
                     print(f"{body}")
                     print(f"翻译 API 返回 {r.status_code}: {r.text}")
@@ -252,21 +552,101 @@ class TranslatorAPI_MIC:
                 print(f"{body}")
                 print("调用翻译 API 出错：", e)
             attempt += 1
-            time.sleep(2 ** attempt)
+            if attempt < retry:
+                await asyncio.sleep(retry_delay(attempt, r))
 
         # 多次失败：返回空译文（保持长度一致）
         return [""] * len(texts)
 
-    def translate_html(self, html, lang=None):
+    @staticmethod
+    def _chunk_texts(texts):
         """
-翻译 HTML：提取文本 → 批量翻译 → 重建 HTML
+按微软翻译的单次请求上限切分文本列表
         """
-        nodes = extract_text_nodes(html)
-        if not nodes:
-            return html
-        texts = [n["text"] for n in nodes]
-        translated_texts = self.translate_batch(texts, lang=lang)
-        return rebuild_html_from_nodes(html, translated_texts)
+        chunk, chars = [], 0
+        for t in texts:
+            if chunk and (len(chunk) >= MAX_TEXTS_PER_REQUEST or chars + len(t) > MAX_CHARS_PER_REQUEST):
+                yield chunk
+                chunk, chars = [], 0
+            chunk.append(t)
+            chars += len(t)
+        if chunk:
+            yield chunk
+
+    def translate_many(self, texts, lang=None):
+        """
+批量翻译多行文本（HTML / 纯文本），返回与 texts 等长的译文列表
+- 纯文本行整行提交，HTML 行提交其文本节点，全部拼成一个列表
+- 重复文本只提交一次，按每次请求 ≤100 条切块并发提交，再按下标切回各行
+- 空白 / 占位文本及无可翻译节点的 HTML 不请求 API，原样返回
+- 某行任一片段翻译失败则该行译文为空，下次运行可续传
+        """
+        segments = []   # 整个窗口待翻译的文本
+        spans = []      # 每行 (起始下标, 片段数, HTML 树)；纯文本树为 None，解析失败整项为 None
+        for txt in texts:
+            start = len(segments)
+            try:
+                if is_html(txt):
+                    # 解析后的树留在内存里，翻译完成后直接写回，不再二次解析
+                    root, slots, node_texts = _parse_and_collect(txt)
+                    segments.extend(node_texts)
+                    spans.append((start, len(node_texts), (root, slots)))
+                else:
+                    stripped = txt.strip()
+                    if stripped in UNTRANSLATABLE_TEXTS or not TRANSLATABLE_RE.search(stripped):
+                        # 空白 / 占位 / 无字母文本：不请求 API，原样写回
+                        spans.append((start, 0, None))
+                    else:
+                        segments.append(txt)
+                        spans.append((start, 1, None))
+            except Exception as e:
+                print(f"解析 HTML 出错: {e}")
+                del segments[start:]
+                spans.append(None)
+
+        # 先去掉缓存命中与窗口内重复的文本，只提交剩余部分；同时在途请求数不超过连接数
+        async def gather_all():
+            sem = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+
+            async def bounded(chunk):
+                async with sem:
+                    return await self.translate_batch_async(chunk, lang=lang)
+
+            return await asyncio.gather(*[bounded(chunk) for chunk in chunks])
+
+        found, misses = self._lookup_cache(segments, lang)
+        chunks = list(self._chunk_texts(misses))
+        for chunk, part in zip(chunks, self._run(gather_all())):
+            found.update(zip(chunk, part))
+        translated = [found[seg] for seg in segments]
+
+        out = []
+        for txt, span in zip(texts, spans):
+            if span is None:
+                out.append("")
+                continue
+            start, count, tree = span
+            part = translated[start:start + count]
+            if not count:
+                # 无需翻译的行（含无可翻译文本节点的 HTML）原样返回
+                out.append(txt)
+            elif not all(part):
+                out.append("")
+            elif tree is None:
+                out.append(part[0])
+            else:
+                root, slots = tree
+                out.append(_render_html(root, slots, txt, part))
+        return out
+
+    def close(self):
+        if self._loop is None:
+            return
+        if self._client is not None:
+            self._loop.run_until_complete(self._client.aclose())
+            self._client = None
+        self._loop.close()
+        self._loop = None
 
 
 # ---------- 交互选择 ----------
@@ -300,15 +680,167 @@ def interactive_select_columns(tables_cols):
 
 
 # ---------- 翻译并写回（断点续传、失败不写） ----------
-def translate_and_update(conn, translator, selections, schema, lang="de", batch_size=10):
+def _queue_put(q, item, give_up):
+    """
+放入有界队列；give_up() 为真（对端线程已退出）时放弃，避免永久阻塞
+    """
+    while not give_up():
+        try:
+            q.put(item, timeout=0.5)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def _read_windows(conn, column_sql, window_size, out_q, stop):
+    """
+读取线程：按页读取待翻译的行，每页作为一个窗口放入 out_q，结束时放入 None
+    """
+    pages = iter_pending_pages(conn, column_sql, page_size=window_size)
+    try:
+        for rows in pages:
+            if not _queue_put(out_q, rows, stop.is_set):
+                break
+    finally:
+        pages.close()
+        _queue_put(out_q, None, stop.is_set)
+
+
+def _update_groups(updates):
+    """
+把待写回的 [(pk, 译文), ...] 按参数字节数和行数切组，每组一条 UPDATE ... CASE
+    """
+    group, size = [], 0
+    for rid, tr in updates:
+        n = len(tr.encode("utf-8")) + len(str(rid))
+        if group and (size + n > MAX_UPDATE_BYTES or len(group) >= MAX_UPDATE_ROWS):
+            yield group
+            group, size = [], 0
+        group.append((rid, tr))
+        size += n
+    if group:
+        yield group
+
+
+def _execute_update(wconn, wcursor, column_sql, group):
+    params = [v for pair in group for v in pair] + [rid for rid, _ in group]
+    wcursor.execute(column_sql.update(len(group)), params)
+    wconn.commit()
+
+
+def _reset_write_cursor(wconn, wcursor):
+    """
+写回出错后回滚并确认连接可用（如包过大时服务端会断开连接），返回新的预处理游标
+    """
+    try:
+        wconn.rollback()
+    except Exception:
+        pass
+    try:
+        wcursor.close()
+    except Exception:
+        pass
+    wconn.ping(reconnect=True)
+    return _prepared_cursor(wconn)
+
+
+def _write_updates(wconn, wcursor, column_sql, updates, stats):
+    """
+写回一个窗口：按字节数分组合并 UPDATE；某组失败时改为逐行写回，只有真正失败的行计为失败
+返回当前使用的写回游标（出错重连后会换新游标）
+    """
+    for group in _update_groups(updates):
+        try:
+            _execute_update(wconn, wcursor, column_sql, group)
+            stats["ok"] += len(group)
+            continue
+        except Exception as e:
+            wcursor = _reset_write_cursor(wconn, wcursor)
+            if len(group) == 1:
+                print(f"更新失败 行 {group[0][0]}: {e}")
+                stats["fail"] += 1
+                continue
+            print(f"批量更新失败 行 {group[0][0]}..{group[-1][0]}，改为逐行写回: {e}")
+
+        for row in group:
+            try:
+                _execute_update(wconn, wcursor, column_sql, [row])
+                stats["ok"] += 1
+            except Exception as e:
+                wcursor = _reset_write_cursor(wconn, wcursor)
+                print(f"更新失败 行 {row[0]}: {e}")
+                stats["fail"] += 1
+    return wcursor
+
+
+def _write_windows(wconn, column_sql, in_q, stats):
+    """
+写回线程：从 in_q 取出 (ids, translations) 写回数据库，取到 None 结束
+    """
+    # 写回用预处理游标；同样行数的 UPDATE 复用同一个 SQL 字符串，避免重复预处理
+    wcursor = _prepared_cursor(wconn)
+    done = 0
+    try:
+        while True:
+            item = in_q.get()
+            if item is None:
+                break
+            ids, translations = item
+
+            updates = []
+            for rid, tr in zip(ids, translations):
+                # 失败的行译文为空串；原样写回的空白文本也算完成
+                if tr:
+                    updates.append((rid, tr))
+                else:
+                    print(f"翻译失败，跳过 行 {rid}")
+                    stats["fail"] += 1
+
+            if updates:
+                # 合并为 UPDATE ... CASE，只写目标列，不覆盖原始列
+                wcursor = _write_updates(wconn, wcursor, column_sql, updates, stats)
+
+            done += len(ids)
+            print(f"已处理 {min(done, stats['total'])}/{stats['total']} 行")
+    finally:
+        wcursor.close()
+
+
+def translate_and_update(pool, translator, selections, schema, lang="de", batch_size=10):
     """
     使用 TranslatorAPI_MIC 对 HTML/文本列进行翻译并写回数据库。
     支持断点续传：翻译失败的行下次可继续翻译，不覆盖原始列。
+    读取、翻译、写回三段流水线并行：读取线程取第 N+1 个窗口时翻译第 N 个，写回线程写第 N-1 个。
+    pool: 数据库连接池，读取与写回各用一个连接
     selections: {table_name: [col1, col2, ...], ...}
     schema: 数据库名
     lang: 目标语言
-    batch_size: 每次批量处理行数
+    batch_size: 每次批量处理行数，每个窗口读取 batch_size * WINDOW_BATCHES 行并发翻译
     """
+    conn = wconn = None
+    try:
+        conn = pool.get_connection()
+        wconn = pool.get_connection()
+        with ThreadPoolExecutor(max_workers=2, thread_name_prefix="translate-db") as executor:
+            return _translate_and_update(conn, wconn, executor, translator, selections, schema, lang, batch_size)
+    finally:
+        # 连接池不重置会话（pool_reset_session=False），归还前结束未完成的事务；
+        # 清理失败只打印，不掩盖原始异常，也不影响另一个连接的关闭
+        for c in (wconn, conn):
+            if c is None:
+                continue
+            try:
+                c.rollback()
+            except Exception as e:
+                print(f"回滚连接失败: {e}")
+            try:
+                c.close()
+            except Exception as e:
+                print(f"关闭连接失败: {e}")
+
+
+def _translate_and_update(conn, wconn, executor, translator, selections, schema, lang, batch_size):
     summary = {}
     for table, cols in selections.items():
         if not cols:
@@ -323,88 +855,52 @@ def translate_and_update(conn, translator, selections, schema, lang="de", batch_
 
         for col in cols:
             target_col = f"{col}_{lang}"
-            add_target_column_if_needed(conn, table, target_col, schema=schema)
+            add_target_column_if_needed(conn, table, target_col, schema)
+
+            # 本列用到的 SQL 一次构造好，循环内只传参数
+            column_sql = build_column_sql(table, pk, col, target_col)
 
-            # 统计待翻译行数
+            # 统计待翻译行数（只统计一次，用于显示进度）
             cursor = conn.cursor()
-            sql_count = f"""
-SELECT COUNT(*)
-FROM {quote_ident(table)}
-WHERE {quote_ident(col)} IS NOT NULL
-  AND {quote_ident(col)} <> ''
-  AND ({quote_ident(target_col)} IS NULL OR {quote_ident(target_col)} = '')
-"""
-            cursor.execute(sql_count)
+            cursor.execute(column_sql.count)
             total = cursor.fetchone()[0]
             cursor.close()
+            conn.commit()
 
             print(f"\n表 {table} 列 {col} 需要翻译 {total} 行")
             summary[table][col] = {"total": total, "ok": 0, "fail": 0}
 
-            offset = 0
-            while offset < total:
-                cursor = conn.cursor()
-                sql = f"""
-SELECT {quote_ident(pk)}, {quote_ident(col)}
-FROM {quote_ident(table)}
-WHERE {quote_ident(col)} IS NOT NULL
-  AND {quote_ident(col)} <> ''
-  AND ({quote_ident(target_col)} IS NULL OR {quote_ident(target_col)} = '')
-LIMIT %s OFFSET %s
-"""
-                cursor.execute(sql, (batch_size, offset))
-                rows = cursor.fetchall()
-                cursor.close()
-
-                if not rows:
-                    break
-
-                ids = [r[0] for r in rows]
-                texts = [r[1] or "" for r in rows]
-
-                # 使用 TranslatorAPI_MIC 翻译 HTML
-                try:
-                    translations = []
-                    for txt in texts:
-                        try:
-                            if is_html(txt):
-                                # HTML 文本 → 提取节点翻译
-                                tr = translator.translate_html(txt, lang=lang)
-                            else:
-                                # 纯文本 → 直接批量翻译
-                                tr = translator.translate_batch([txt], lang=lang)[0]
-                            translations.append(tr)
-                        except Exception as e:
-                            print(f"翻译出错: {e}")
-                            translations.append("")
-
-                except Exception as e:
-                    print(f"批量翻译 HTML 出错: {e}")
-                    translations = [""] * len(texts)
-
-                # 写回数据库
-                cursor = conn.cursor()
-                for rid, src, tr in zip(ids, texts, translations):
-                    if tr and tr.strip():
-                        try:
-                            sql_up = f"""
-UPDATE {quote_ident(table)}
-SET {quote_ident(target_col)} = %s , {quote_ident(col)} = %s
-WHERE {quote_ident(pk)} = %s
-"""
-                            cursor.execute(sql_up, (tr,tr, rid))
-                            summary[table][col]["ok"] += 1
-                        except Exception as e:
-                            print(f"更新失败 行 {rid}: {e}")
-                            summary[table][col]["fail"] += 1
-                    else:
-                        print(f"翻译失败，跳过 行 {rid}")
-                        summary[table][col]["fail"] += 1
-                conn.commit()
-                cursor.close()
+            # 读取线程 → read_q → 翻译（当前线程）→ write_q → 写回线程；队列有界，内存占用恒定
+            window_size = batch_size * WINDOW_BATCHES
+            read_q = queue.Queue(maxsize=PIPELINE_DEPTH)
+            write_q = queue.Queue(maxsize=PIPELINE_DEPTH)
+            stop = threading.Event()
+            reader = executor.submit(_read_windows, conn, column_sql, window_size, read_q, stop)
+            writer = executor.submit(_write_windows, wconn, column_sql, write_q, summary[table][col])
+            try:
+                while True:
+                    rows = read_q.get()
+                    if rows is None:
+                        break
 
-                offset += batch_size
-                print(f"已处理 {min(offset, total)}/{total} 行")
+                    ids = [r[0] for r in rows]
+                    texts = [r[1] or "" for r in rows]
+
+                    # 整个窗口的行并发翻译
+                    try:
+                        translations = translator.translate_many(texts, lang=lang)
+                    except Exception as e:
+                        print(f"批量翻译 HTML 出错: {e}")
+                        translations = [""] * len(texts)
+
+                    if not _queue_put(write_q, (ids, translations), writer.done):
+                        break
+            finally:
+                stop.set()
+                _queue_put(write_q, None, writer.done)
+            # 抛出读取 / 写回线程中的异常
+            reader.result()
+            writer.result()
 
     return summary
 
@@ -426,9 +922,10 @@ def run():
         print("配置已保存到 config.json")
 
     # 连接 DB（确保使用与你安装驱动相同的 Python）
-    conn = get_db_connection(cfg)
+    pool = get_db_pool(cfg)
 
     # 查找表
+    # conn = pool.get_connection()
     # tables = find_target_tables(conn, cfg["database"])
     # if not tables:
     #     print("未找到 fa_ldcms_document 相关表（请确认数据库名和表名前缀）")
@@ -449,11 +946,13 @@ def run():
     #微软翻译api
     translator = TranslatorAPI_MIC(cfg["api_key"], cfg["api_region"])
 
-    summary = translate_and_update(conn, translator, selections, schema=cfg["database"], lang="de", batch_size=cfg.get("batch_size", 10))
+    try:
+        summary = translate_and_update(pool, translator, selections, schema=pool.database, lang="de", batch_size=cfg.get("batch_size", 10))
+    finally:
+        translator.close()
 
     print("\n=== 翻译总结 ===")
-    print(json.dumps(summary, ensure_ascii=False, indent=2))
-    conn.close()
+    print(orjson.dumps(summary, option=orjson.OPT_INDENT_2).decode("utf-8"))
 
 
 if __name__ == "__main__":